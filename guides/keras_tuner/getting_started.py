@@ -2,7 +2,7 @@
 Title: Getting started with KerasTuner
 Authors: Luca Invernizzi, James Long, Francois Chollet, Tom O'Malley, Haifeng Jin
 Date created: 2019/05/31
-Last modified: 2021/10/27
+Last modified: 2026/10/15
 Description: The basics of using KerasTuner to tune model hyperparameters.
 """
 
@@ -20,6 +20,25 @@ it to tune scikit-learn models, or anything else. In this tutorial, you will
 see how to tune model architecture, training process, and data preprocessing
 steps with KerasTuner. Let's start from a simple example.
 
+First, we import TensorFlow. When several tuning processes share one GPU (see
+the section on running the trials in parallel below), we limit the GPU memory
+of each of them. This has to be done before TensorFlow initializes the GPU.
+"""
+
+import os
+
+import tensorflow as tf
+
+# Set by the launch script when several workers share one GPU.
+gpu_memory_limit = os.environ.get("GPU_MEMORY_LIMIT")
+gpus = tf.config.list_physical_devices("GPU")
+if gpu_memory_limit and gpus:
+    tf.config.set_logical_device_configuration(
+        gpus[0],
+        [tf.config.LogicalDeviceConfiguration(memory_limit=int(gpu_memory_limit))],
+    )
+
+"""
 ## Tune the model architecture
 
 The first thing we need to do is writing a function, which returns a compiled
@@ -51,7 +70,7 @@ def build_model(hp):
     )
     model.add(layers.Dense(10, activation="softmax"))
     model.compile(
-        optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"],
+        optimizer="adam", loss="sparse_categorical_crossentropy", metrics=["accuracy"],
     )
     return model
 
@@ -92,7 +111,7 @@ def build_model(hp):
     learning_rate = hp.Float("lr", min_value=1e-4, max_value=1e-2, sampling="log")
     model.compile(
         optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
-        loss="categorical_crossentropy",
+        loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
     )
     return model
@@ -125,7 +144,7 @@ def call_existing_code(units, activation, dropout, lr):
     model.add(layers.Dense(10, activation="softmax"))
     model.compile(
         optimizer=keras.optimizers.Adam(learning_rate=lr),
-        loss="categorical_crossentropy",
+        loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
     )
     return model
@@ -149,6 +168,8 @@ build_model(keras_tuner.HyperParameters())
 Each of the hyperparameters is uniquely identified by its name (the first
 argument). To tune the number of units in different `Dense` layers separately
 as different hyperparameters, we give them different names as `f"units_{i}"`.
+The maximum number of layers is defined once in `MAX_LAYERS`, and `UNIT_NAMES`
+lists the names of the hyperparameters for these layers.
 
 Notably, this is also an example of creating conditional hyperparameters.
 There are many hyperparameters specifying the number of units in the `Dense`
@@ -159,28 +180,38 @@ when a certain condition is satisfied. For example, `units_3` is only used
 when `num_layers` is larger than 3. With KerasTuner, you can easily define
 such hyperparameters dynamically while creating the model.
 
+We also tell the oracle about this condition by creating each `units_{i}` in
+`hp.conditional_scope()`. The hyperparameter is only active when `num_layers`
+is one of the given values, which is always true when it is created. The
+oracles only sample the values of the active hyperparameters. For example,
+`BayesianOptimization` does not fit its model to the values of `units_2` in the
+trials with fewer than 3 layers, which did not use them. Only the `units_{i}`
+go in the scopes: a hyperparameter created in another scope is a different
+hyperparameter, so we create `activation` once, before the loop.
 """
 
+MAX_LAYERS = 3
+UNIT_NAMES = tuple(f"units_{i}" for i in range(MAX_LAYERS))
+
 
 def build_model(hp):
     model = keras.Sequential()
     model.add(layers.Flatten())
+    activation = hp.Choice("activation", ["relu", "tanh"])
     # Tune the number of layers.
-    for i in range(hp.Int("num_layers", 1, 3)):
-        model.add(
-            layers.Dense(
-                # Tune number of units separately.
-                units=hp.Int(f"units_{i}", min_value=32, max_value=512, step=32),
-                activation=hp.Choice("activation", ["relu", "tanh"]),
-            )
-        )
+    for i in range(hp.Int("num_layers", 1, MAX_LAYERS)):
+        # The layer only exists when `num_layers` is larger than `i`.
+        with hp.conditional_scope("num_layers", list(range(i + 1, MAX_LAYERS + 1))):
+            # Tune number of units separately.
+            units = hp.Int(UNIT_NAMES[i], min_value=32, max_value=512, step=32)
+        model.add(layers.Dense(units=units, activation=activation))
     if hp.Boolean("dropout"):
         model.add(layers.Dropout(rate=0.25))
     model.add(layers.Dense(10, activation="softmax"))
     learning_rate = hp.Float("lr", min_value=1e-4, max_value=1e-2, sampling="log")
     model.compile(
         optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
-        loss="categorical_crossentropy",
+        loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
     )
     return model
@@ -191,10 +222,33 @@ build_model(keras_tuner.HyperParameters())
 """
 ### Start the search
 
-After defining the search space, we need to select a tuner class to run the
-search. You may choose from `RandomSearch`, `BayesianOptimization` and
-`Hyperband`, which correspond to different tuning algorithms. Here we use
-`RandomSearch` as an example.
+Before starting the search, let's prepare the MNIST dataset. We keep the images
+as `uint8`, which takes a quarter of the memory of `float32`, and only add a
+channel axis, which does not copy the data. The labels stay integer class
+indices, which we train on with the `"sparse_categorical_crossentropy"` loss,
+instead of being converted to one-hot vectors.
+"""
+
+import numpy as np
+from tensorflow import keras
+
+(x, y), (x_test, y_test) = keras.datasets.mnist.load_data()
+
+x = x[..., np.newaxis]
+x_test = x_test[..., np.newaxis]
+
+# The splits are views of `x` and `y`, which we use later to train on all the
+# data without concatenating the splits again.
+x_train = x[:-10000]
+x_val = x[-10000:]
+y_train = y[:-10000]
+y_val = y[-10000:]
+
+"""
+After defining the search space and preparing the data, we need to select a
+tuner class to run the search. You may choose from `RandomSearch`,
+`BayesianOptimization` and `Hyperband`, which correspond to different tuning
+algorithms. Here we use `RandomSearch` as an example.
 
 To initialize the tuner, we need to specify several arguments in the initializer.
 
@@ -215,10 +269,90 @@ directory or resume the previous search instead. Here we set `overwrite=True`
 to start a new search and ignore any previous results.
 * `directory`. A path to a directory for storing the search results.
 * `project_name`. The name of the sub-directory in the `directory`.
-
+* `distribution_strategy`. A `tf.distribute.Strategy` instance to train each
+model with. With `tf.distribute.MirroredStrategy`, every model is trained on all
+the GPUs of the machine with data parallelism. We keep the batch size per GPU
+constant by scaling the global batch size with the number of GPUs.
+
+The extra executions of a trial are only worth their cost if the trial may be
+one of the best ones. Instead of the plain `RandomSearch`, we use a subclass of
+it, which only runs the extra executions of a trial if the score of its first
+execution is within two standard deviations of the best score so far. The
+standard deviation is computed on the scores of the last 10 trials.
+
+The subclass overrides `run_trial()`, which builds and fits the models of a
+trial with the hypermodel, and returns the `History` objects of the executions
+it ran. The score of an execution is the best value of the objective over its
+epochs. Since we train the models ourselves, we also save the best weights of
+each trial with a `ModelCheckpoint` callback, and override `load_model()` to
+load them, which is used to retrieve the best models after the search.
 """
 
-tuner = keras_tuner.RandomSearch(
+
+class AdaptiveRandomSearch(keras_tuner.RandomSearch):
+    def __init__(self, *args, window_size=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.window_size = window_size
+        self.scores = []
+
+    def run_trial(self, trial, *args, callbacks=(), **kwargs):
+        hp = trial.hyperparameters
+        objective = self.oracle.objective
+        histories = []
+        first_score = None
+        for _ in range(self.executions_per_trial):
+            # Skip the remaining executions of an unpromising trial.
+            if first_score is not None and not self.is_promising(first_score):
+                break
+            model = self.build_trial_model(hp)
+            checkpoint = keras.callbacks.ModelCheckpoint(
+                self.get_checkpoint_path(trial),
+                monitor=objective.name,
+                mode=objective.direction,
+                save_best_only=True,
+                save_weights_only=True,
+            )
+            history = self.hypermodel.fit(
+                hp, model, *args, callbacks=[*callbacks, checkpoint], **kwargs
+            )
+            histories.append(history)
+            if first_score is None:
+                first_score = self.get_score(history)
+        self.scores.append(first_score)
+        return histories
+
+    def load_model(self, trial):
+        model = self.build_trial_model(trial.hyperparameters)
+        model.load_weights(self.get_checkpoint_path(trial))
+        return model
+
+    def build_trial_model(self, hp):
+        strategy = self.distribution_strategy or tf.distribute.get_strategy()
+        with strategy.scope():
+            return self.hypermodel.build(hp)
+
+    def get_checkpoint_path(self, trial):
+        return os.path.join(self.get_trial_dir(trial.trial_id), "checkpoint")
+
+    def get_score(self, history):
+        objective = self.oracle.objective
+        values = history.history[objective.name]
+        return max(values) if objective.direction == "max" else min(values)
+
+    def is_promising(self, score):
+        # Too few completed trials to estimate the spread of the scores.
+        if len(self.scores) < 2:
+            return True
+        margin = 2 * np.std(self.scores[-self.window_size :])
+        if self.oracle.objective.direction == "max":
+            return score >= max(self.scores) - margin
+        return score <= min(self.scores) + margin
+
+
+strategy = tf.distribute.MirroredStrategy()
+batch_size = 128 * strategy.num_replicas_in_sync
+
+tuner = AdaptiveRandomSearch(
     hypermodel=build_model,
     objective="val_accuracy",
     max_trials=3,
@@ -226,6 +360,7 @@ tuner = keras_tuner.RandomSearch(
     overwrite=True,
     directory="my_dir",
     project_name="helloworld",
+    distribution_strategy=strategy,
 )
 
 """
@@ -235,35 +370,149 @@ You can print a summary of the search space:
 tuner.search_space_summary()
 
 """
-Before starting the search, let's prepare the MNIST dataset.
+We build the `tf.data` datasets once, and reuse them in all the trials. The
+images stay `uint8` in memory, and are converted to `float32` and scaled to
+[0, 1] batch by batch. The training data is reshuffled in every epoch, and the
+next batches are prefetched during training.
 """
 
-from tensorflow import keras
-import numpy as np
 
-(x, y), (x_test, y_test) = keras.datasets.mnist.load_data()
+def scale_images(images, labels):
+    return tf.cast(images, "float32") / 255.0, labels
 
-x_train = x[:-10000]
-x_val = x[-10000:]
-y_train = y[:-10000]
-y_val = y[-10000:]
 
-x_train = np.expand_dims(x_train, -1).astype("float32") / 255.0
-x_val = np.expand_dims(x_val, -1).astype("float32") / 255.0
-x_test = np.expand_dims(x_test, -1).astype("float32") / 255.0
+def make_dataset(images, labels, shuffle=False):
+    dataset = tf.data.Dataset.from_tensor_slices((images, labels))
+    if shuffle:
+        dataset = dataset.shuffle(len(images), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(scale_images, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
 
-num_classes = 10
-y_train = keras.utils.to_categorical(y_train, num_classes)
-y_val = keras.utils.to_categorical(y_val, num_classes)
-y_test = keras.utils.to_categorical(y_test, num_classes)
+
+train_ds = make_dataset(x_train, y_train, shuffle=True)
+val_ds = make_dataset(x_val, y_val)
 
 """
 Then, start the search for the best hyperparameter configuration.
 All the arguments passed to `search` is passed to `model.fit()` in each
-execution. Remember to pass `validation_data` to evaluate the model.
+execution. Remember to pass `validation_data` to evaluate the model. The
+datasets are already batched, so we do not pass a `batch_size`.
+
+Some configurations are clearly bad after the first epoch, for example when a
+high learning rate makes the training diverge. We stop their training early
+with a `MedianPruner` callback, which is passed to `model.fit()` as well. It
+stops a model when, at the end of an epoch:
+
+* it is the first epoch, and the validation accuracy is below the `baseline`,
+* or the validation accuracy is below the median validation accuracy of the
+previous executions at the same epoch.
+
+To monitor a metric to minimize, like `"val_loss"`, pass `mode="min"`: the
+callback then stops the models above the `baseline` or the median. The
+built-in tuners copy the callbacks for each execution, so we make the copies
+share the same `history`. When running in parallel as shown below, each worker keeps
+its own `history`.
 """
 
-tuner.search(x_train, y_train, epochs=2, validation_data=(x_val, y_val))
+import statistics
+
+
+class MedianPruner(keras.callbacks.Callback):
+    def __init__(
+        self,
+        monitor="val_accuracy",
+        mode="max",
+        baseline=0.5,
+        min_history=3,
+        history=None,
+    ):
+        super().__init__()
+        self.monitor = monitor
+        self.mode = mode
+        self.baseline = baseline
+        self.min_history = min_history
+        # Maps each epoch to the values of `monitor` of the previous executions.
+        self.history = {} if history is None else history
+
+    def __deepcopy__(self, memo):
+        # Share the history with the copies made by the tuner.
+        return MedianPruner(
+            self.monitor, self.mode, self.baseline, self.min_history, self.history
+        )
+
+    def is_worse(self, value, reference):
+        if self.mode == "max":
+            return value < reference
+        return value > reference
+
+    def on_epoch_end(self, epoch, logs=None):
+        value = (logs or {}).get(self.monitor)
+        # The metric is missing, for example without validation data.
+        if value is None:
+            return
+        if epoch == 0 and self.is_worse(value, self.baseline):
+            self.model.stop_training = True
+        previous_values = self.history.setdefault(epoch, [])
+        if len(previous_values) >= self.min_history:
+            if self.is_worse(value, statistics.median(previous_values)):
+                self.model.stop_training = True
+        previous_values.append(value)
+
+
+callbacks = [MedianPruner()]
+
+"""
+### Run the trials in parallel on multiple GPUs
+
+By default, the trials run one after another in a single process, which only
+uses one GPU. The trials are independent from each other, so on a machine with
+several GPUs you can run them in parallel with the distributed mode of
+KerasTuner: a chief process runs the oracle, and several worker processes, each
+pinned to a GPU, ask it for new trials and report their results.
+
+The processes are configured with environment variables, which are described in
+the [distributed tuning guide](https://keras.io/guides/keras_tuner/distributed_tuning/).
+
+The models in this search space are small. The largest one has three `Dense`
+layers of 512 units, which is about 0.9M parameters: less than 4 MB in float32,
+and about 15 MB with the gradients and the states of the Adam optimizer. A
+single worker only uses a small fraction of a GPU, so we can run several
+workers per GPU, each limited to its share of the GPU memory.
+
+For example, if you save the code of this guide up to and including the
+`search()` call below in `run_tuning.py`, the following script runs it with 4
+workers per GPU:
+
+```
+NUM_GPUS=8
+WORKERS_PER_GPU=4
+GPU_MEMORY=$(nvidia-smi --query-gpu=memory.total --format=csv,noheader,nounits -i 0)
+export KERASTUNER_ORACLE_IP="127.0.0.1"
+export KERASTUNER_ORACLE_PORT="8000"
+# GPU memory of each worker in MB, leaving room for its CUDA context.
+export GPU_MEMORY_LIMIT=$((GPU_MEMORY / WORKERS_PER_GPU - 512))
+
+# The chief only runs the oracle, so it does not need a GPU.
+KERASTUNER_TUNER_ID="chief" CUDA_VISIBLE_DEVICES="" python run_tuning.py &
+
+for i in $(seq 0 $((NUM_GPUS * WORKERS_PER_GPU - 1))); do
+  KERASTUNER_TUNER_ID="tuner$i" CUDA_VISIBLE_DEVICES=$((i / WORKERS_PER_GPU)) \
+    python run_tuning.py &
+done
+wait
+```
+
+All the processes should use the same `directory` (`"my_dir"` here), which must
+be on a file system shared by all of them. The chief process blocks while
+creating the tuner until the search is over, and then goes on with the rest of
+the script. Therefore, we only call `search()` when the process is not the
+chief. When the environment variables are not set, the script runs the search
+in a single process as usual.
+"""
+
+if os.environ.get("KERASTUNER_TUNER_ID") != "chief":
+    tuner.search(train_ds, epochs=2, validation_data=val_ds, callbacks=callbacks)
 
 """
 During the `search`, the model-building function is called with different
@@ -300,6 +549,105 @@ You can also visualize the tuning results using TensorBoard and HParams plugin.
 For more information, please following
 [this link](https://keras.io/guides/keras_tuner/visualize_tuning/).
 
+### Store the search results in a single database
+
+By default, the oracle rewrites a `trial.json` file in the folder of a trial
+every time the trial is updated. When many workers report to the same oracle,
+all these small file writes can slow the search down.
+
+You can change where the oracle stores its state by overriding a few of its
+methods. In the following example, we subclass `RandomSearchOracle` to store the
+trials and the oracle state in a single SQLite database, `oracle.db`, in the
+project folder. The oracle keeps one connection open, and each trial update
+becomes a single write inside a transaction. The database uses
+[write-ahead logging](https://www.sqlite.org/wal.html), so the file stays
+consistent if the process crashes, and the search can be resumed from it.
+Only the oracle state moves to the database: the tuner still saves the
+checkpoints of the models in the `trial_*` folders.
+"""
+
+import json
+import sqlite3
+
+
+class SQLiteRandomSearchOracle(keras_tuner.oracles.RandomSearchOracle):
+    def _get_oracle_fname(self):
+        return os.path.join(self._project_dir, "oracle.db")
+
+    @property
+    def _connection(self):
+        # Open the database and create the tables on first use only.
+        if getattr(self, "_sqlite_connection", None) is None:
+            # Take the write lock when the transaction begins. In distributed
+            # mode, the oracle is called from the threads of the gRPC server.
+            connection = sqlite3.connect(
+                self._get_oracle_fname(),
+                timeout=60,
+                isolation_level="IMMEDIATE",
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            # With write-ahead logging, this only syncs at checkpoints and is
+            # still safe if the process crashes.
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS trials "
+                "(trial_id TEXT PRIMARY KEY, state TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS oracle (id INTEGER PRIMARY KEY, state TEXT)"
+            )
+            self._sqlite_connection = connection
+        return self._sqlite_connection
+
+    def _save_trial(self, trial):
+        with self._connection as connection:
+            connection.execute(
+                "REPLACE INTO trials VALUES (?, ?)",
+                (trial.trial_id, json.dumps(trial.get_state())),
+            )
+
+    def save(self):
+        with self._connection as connection:
+            connection.execute(
+                "REPLACE INTO oracle VALUES (0, ?)", (json.dumps(self.get_state()),)
+            )
+
+    def reload(self):
+        connection = self._connection
+        for (state,) in connection.execute("SELECT state FROM trials"):
+            trial = keras_tuner.engine.trial.Trial.from_state(json.loads(state))
+            self.trials[trial.trial_id] = trial
+        row = connection.execute("SELECT state FROM oracle").fetchone()
+        if row is not None:
+            self.set_state(json.loads(row[0]))
+        # Like `Oracle.reload()`, run the trials that were interrupted again,
+        # instead of leaving them assigned to their old tuner IDs. Versions of
+        # KerasTuner without a retry queue create new trials in their place.
+        for trial in self.ongoing_trials.values():
+            if hasattr(self, "_retry_queue"):
+                self._retry_queue.append(trial.trial_id)
+            else:
+                del self.trials[trial.trial_id]
+        self.ongoing_trials = {}
+
+
+"""
+To use the oracle, pass it to `keras_tuner.Tuner` together with the
+hypermodel.
+"""
+
+tuner = keras_tuner.Tuner(
+    oracle=SQLiteRandomSearchOracle(objective="val_accuracy", max_trials=3),
+    hypermodel=build_model,
+    overwrite=True,
+    directory="my_dir",
+    project_name="helloworld_sqlite",
+    distribution_strategy=strategy,
+)
+tuner.search(train_ds, epochs=2, validation_data=val_ds)
+
+"""
 ### Retrain the model
 
 If you want to train the model with the entire dataset, you may retrieve the
@@ -311,9 +659,7 @@ best_hps = tuner.get_best_hyperparameters(5)
 # Build the model with the best hp.
 model = build_model(best_hps[0])
 # Fit with the entire dataset.
-x_all = np.concatenate((x_train, x_val))
-y_all = np.concatenate((y_train, y_val))
-model.fit(x=x_all, y=y_all, epochs=1)
+model.fit(make_dataset(x, y, shuffle=True), epochs=1)
 
 """
 ## Tune model training
@@ -353,7 +699,9 @@ class MyHyperModel(keras_tuner.HyperModel):
         )
         model.add(layers.Dense(10, activation="softmax"))
         model.compile(
-            optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"],
+            optimizer="adam",
+            loss="sparse_categorical_crossentropy",
+            metrics=["accuracy"],
         )
         return model
 
@@ -373,7 +721,7 @@ Again, we can do a quick check to see if the code works correctly.
 hp = keras_tuner.HyperParameters()
 hypermodel = MyHyperModel()
 model = hypermodel.build(hp)
-hypermodel.fit(hp, model, np.random.rand(100, 28, 28), np.random.rand(100, 10))
+hypermodel.fit(hp, model, np.random.rand(100, 28, 28), np.random.randint(10, size=100))
 
 """
 ## Tune data preprocessing
@@ -384,8 +732,16 @@ following code, we tune whether to normalize the data before training the
 model. This time we explicitly put `x` and `y` in the function signature
 because we need to use them.
 
+The mean and variance used to normalize the images are properties of the
+dataset, not of the trial. We compute them once, before the search, with a
+`Normalization` layer, which streams over the training dataset batch by batch.
+With `axis=None`, it computes a single mean and variance over all the pixels,
+so we can use it on images of any size.
 """
 
+normalizer = layers.Normalization(axis=None)
+normalizer.adapt(train_ds.map(lambda images, labels: images))
+
 
 class MyHyperModel(keras_tuner.HyperModel):
     def build(self, hp):
@@ -399,13 +755,15 @@ class MyHyperModel(keras_tuner.HyperModel):
         )
         model.add(layers.Dense(10, activation="softmax"))
         model.compile(
-            optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"],
+            optimizer="adam",
+            loss="sparse_categorical_crossentropy",
+            metrics=["accuracy"],
         )
         return model
 
     def fit(self, hp, model, x, y, **kwargs):
         if hp.Boolean("normalize"):
-            x = layers.Normalization()(x)
+            x = normalizer(x)
         return model.fit(
             x,
             y,
@@ -418,13 +776,16 @@ class MyHyperModel(keras_tuner.HyperModel):
 hp = keras_tuner.HyperParameters()
 hypermodel = MyHyperModel()
 model = hypermodel.build(hp)
-hypermodel.fit(hp, model, np.random.rand(100, 28, 28), np.random.rand(100, 10))
+hypermodel.fit(hp, model, np.random.rand(100, 28, 28), np.random.randint(10, size=100))
 
 """
 If a hyperparameter is used both in `build()` and `fit()`, you can define it in
 `build()` and use `hp.get(hp_name)` to retrieve it in `fit()`. We use the
 image size as an example. It is both used as the input shape in `build()`, and
-used by data prerprocessing step to crop the images in `fit()`.
+used by data prerprocessing step to crop the images in `fit()`. This time, we
+pass the `tf.data` datasets to `search()`. `fit()` crops and normalizes them
+batch by batch with `Dataset.map()`, so the cropped dataset is never copied as a
+whole.
 """
 
 
@@ -440,27 +801,28 @@ class MyHyperModel(keras_tuner.HyperModel):
         outputs = layers.Dense(10, activation="softmax")(outputs)
         model = keras.Model(inputs, outputs)
         model.compile(
-            optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"],
+            optimizer="adam",
+            loss="sparse_categorical_crossentropy",
+            metrics=["accuracy"],
         )
         return model
 
-    def fit(self, hp, model, x, y, validation_data=None, **kwargs):
-        if hp.Boolean("normalize"):
-            x = layers.Normalization()(x)
+    def fit(self, hp, model, x, validation_data=None, **kwargs):
         image_size = hp.get("image_size")
-        cropped_x = x[:, :image_size, :image_size, :]
+        normalize = hp.Boolean("normalize")
+
+        def preprocess(images, labels):
+            images = images[:, :image_size, :image_size, :]
+            if normalize:
+                images = normalizer(images)
+            return images, labels
+
+        dataset = x.map(preprocess, num_parallel_calls=tf.data.AUTOTUNE)
         if validation_data:
-            x_val, y_val = validation_data
-            cropped_x_val = x_val[:, :image_size, :image_size, :]
-            validation_data = (cropped_x_val, y_val)
-        return model.fit(
-            cropped_x,
-            y,
-            # Tune whether to shuffle the data in each epoch.
-            shuffle=hp.Boolean("shuffle"),
-            validation_data=validation_data,
-            **kwargs,
-        )
+            validation_data = validation_data.map(
+                preprocess, num_parallel_calls=tf.data.AUTOTUNE
+            )
+        return model.fit(dataset, validation_data=validation_data, **kwargs)
 
 
 tuner = keras_tuner.RandomSearch(
@@ -470,9 +832,10 @@ tuner = keras_tuner.RandomSearch(
     overwrite=True,
     directory="my_dir",
     project_name="tune_hypermodel",
+    distribution_strategy=strategy,
 )
 
-tuner.search(x_train, y_train, epochs=2, validation_data=(x_val, y_val))
+tuner.search(train_ds, epochs=2, validation_data=val_ds)
 
 """
 ### Retrain the model
@@ -483,7 +846,7 @@ Using `HyperModel` also allows you to retrain the best model by yourself.
 hypermodel = MyHyperModel()
 best_hp = tuner.get_best_hyperparameters()[0]
 model = hypermodel.build(best_hp)
-hypermodel.fit(best_hp, model, x_all, y_all, epochs=1)
+hypermodel.fit(best_hp, model, make_dataset(x, y, shuffle=True), epochs=1)
 
 """
 ## Specify the tuning objective
@@ -518,13 +881,18 @@ be either `"min"` or `"max"`.
 
 * Pass the wrapped objective to the tuner.
 
-You can see the following barebone code example.
+You can see the following barebone code example. The regression models in this
+section are tiny, so launching their many small operations takes longer than
+computing them. We compile them with `jit_compile=True`, so that XLA fuses the
+operations of each training step into a few kernels, and give them a fixed
+input shape with `keras.Input()`.
 """
 
 
 def build_regressor(hp):
     model = keras.Sequential(
         [
+            keras.Input(shape=(10,)),
             layers.Dense(units=hp.Int("units", 32, 128, 32), activation="relu"),
             layers.Dense(units=1),
         ]
@@ -534,6 +902,7 @@ def build_regressor(hp):
         loss="mean_squared_error",
         # Objective is one of the metrics.
         metrics=[keras.metrics.MeanAbsoluteError()],
+        jit_compile=True,
     )
     return model
 
@@ -547,6 +916,7 @@ tuner = keras_tuner.RandomSearch(
     overwrite=True,
     directory="my_dir",
     project_name="built_in_metrics",
+    distribution_strategy=strategy,
 )
 
 tuner.search(
@@ -577,28 +947,29 @@ tutorial](https://keras.io/guides/customizing_what_happens_in_fit/#going-lowerle
 
 """
 
-import tensorflow as tf
-
 
 class CustomMetric(keras.metrics.Metric):
     def __init__(self, **kwargs):
         # Specify the name of the metric as "custom_metric".
         super().__init__(name="custom_metric", **kwargs)
         self.sum = self.add_weight(name="sum", initializer="zeros")
-        self.count = self.add_weight(name="count", dtype=tf.int32, initializer="zeros")
+        # The count is a float, so that it can sum fractional sample weights.
+        self.count = self.add_weight(name="count", initializer="zeros")
 
     def update_state(self, y_true, y_pred, sample_weight=None):
+        y_true = tf.cast(y_true, self.dtype)
+        y_pred = tf.cast(y_pred, self.dtype)
         values = tf.math.squared_difference(y_pred, y_true)
-        count = tf.shape(y_true)[0]
+        count = tf.cast(tf.shape(y_true)[0], self.dtype)
         if sample_weight is not None:
             sample_weight = tf.cast(sample_weight, self.dtype)
             values *= sample_weight
-            count *= sample_weight
+            count = tf.reduce_sum(sample_weight)
         self.sum.assign_add(tf.reduce_sum(values))
         self.count.assign_add(count)
 
     def result(self):
-        return self.sum / tf.cast(self.count, tf.float32)
+        return self.sum / self.count
 
     def reset_states(self):
         self.sum.assign(0)
@@ -613,6 +984,7 @@ Run the search with the custom objective.
 def build_regressor(hp):
     model = keras.Sequential(
         [
+            keras.Input(shape=(10,)),
             layers.Dense(units=hp.Int("units", 32, 128, 32), activation="relu"),
             layers.Dense(units=1),
         ]
@@ -622,6 +994,7 @@ def build_regressor(hp):
         loss="mean_squared_error",
         # Put custom metric into the metrics.
         metrics=[CustomMetric()],
+        jit_compile=True,
     )
     return model
 
@@ -634,6 +1007,7 @@ tuner = keras_tuner.RandomSearch(
     overwrite=True,
     directory="my_dir",
     project_name="custom_metrics",
+    distribution_strategy=strategy,
 )
 
 tuner.search(
@@ -659,12 +1033,13 @@ class HyperRegressor(keras_tuner.HyperModel):
     def build(self, hp):
         model = keras.Sequential(
             [
+                keras.Input(shape=(10,)),
                 layers.Dense(units=hp.Int("units", 32, 128, 32), activation="relu"),
                 layers.Dense(units=1),
             ]
         )
         model.compile(
-            optimizer="adam", loss="mean_squared_error",
+            optimizer="adam", loss="mean_squared_error", jit_compile=True,
         )
         return model
 
@@ -672,8 +1047,10 @@ class HyperRegressor(keras_tuner.HyperModel):
         model.fit(x, y, **kwargs)
         x_val, y_val = validation_data
         y_pred = model.predict(x_val)
+        # Compute the errors in place, without allocating temporary arrays.
+        errors = np.subtract(y_pred, y_val, out=y_pred)
         # Return a single float to minimize.
-        return np.mean(np.abs(y_pred - y_val))
+        return float(np.abs(errors, out=errors).mean())
 
 
 tuner = keras_tuner.RandomSearch(
@@ -684,6 +1061,7 @@ tuner = keras_tuner.RandomSearch(
     overwrite=True,
     directory="my_dir",
     project_name="custom_eval",
+    distribution_strategy=strategy,
 )
 tuner.search(
     x=np.random.rand(100, 10),
@@ -706,12 +1084,13 @@ class HyperRegressor(keras_tuner.HyperModel):
     def build(self, hp):
         model = keras.Sequential(
             [
+                keras.Input(shape=(10,)),
                 layers.Dense(units=hp.Int("units", 32, 128, 32), activation="relu"),
                 layers.Dense(units=1),
             ]
         )
         model.compile(
-            optimizer="adam", loss="mean_squared_error",
+            optimizer="adam", loss="mean_squared_error", jit_compile=True,
         )
         return model
 
@@ -719,10 +1098,14 @@ class HyperRegressor(keras_tuner.HyperModel):
         model.fit(x, y, **kwargs)
         x_val, y_val = validation_data
         y_pred = model.predict(x_val)
+        # Compute the errors in place, without allocating temporary arrays.
+        errors = np.subtract(y_pred, y_val, out=y_pred)
+        mean_squared_error = float(np.vdot(errors, errors)) / errors.size
+        mean_absolute_error = float(np.abs(errors, out=errors).mean())
         # Return a dictionary of metrics for KerasTuner to track.
         return {
-            "metric_a": -np.mean(np.abs(y_pred - y_val)),
-            "metric_b": np.mean(np.square(y_pred - y_val)),
+            "metric_a": -mean_absolute_error,
+            "metric_b": mean_squared_error,
         }
 
 
@@ -735,6 +1118,7 @@ tuner = keras_tuner.RandomSearch(
     overwrite=True,
     directory="my_dir",
     project_name="custom_eval_dict",
+    distribution_strategy=strategy,
 )
 tuner.search(
     x=np.random.rand(100, 10),
@@ -799,8 +1183,6 @@ identify a trial, to construct different paths to save the models from
 different trials.
 """
 
-import os
-
 
 def keras_code(units, optimizer, saving_path):
     # Build model
@@ -827,7 +1209,8 @@ def keras_code(units, optimizer, saving_path):
     # You may also return a dictionary
     # of {metric_name: metric_value}.
     y_pred = model.predict(x_val)
-    return np.mean(np.abs(y_pred - y_val))
+    errors = np.subtract(y_pred, y_val, out=y_pred)
+    return float(np.abs(errors, out=errors).mean())
 
 
 class MyTuner(keras_tuner.RandomSearch):
@@ -848,13 +1231,91 @@ tuner.search()
 best_hp = tuner.get_best_hyperparameters()[0]
 keras_code(**best_hp.values, saving_path="/tmp/best_model")
 
+"""
+### Run the trials in parallel threads
+
+`search()` runs the trials one after another. You can also run several of them
+at the same time in a thread pool. Only part of the work overlaps: TensorFlow
+releases the Python global interpreter lock while it runs its operations, but
+building the model, tracing `fit()`, saving the model, and running the
+callbacks and the progress bar are Python code, which holds the lock. For tiny
+models like the one in `keras_code()`, this Python code takes most of the time,
+so the speedup is small. It grows with the compute time of each trial. The
+progress bars of the concurrent trials are also printed interleaved, so you may
+want to pass `verbose=0` to `fit()` in your code.
+
+We use threads instead of processes, because TensorFlow does not work in
+processes forked after it has been initialized, and spawned processes would run
+this whole script again.
+
+Only the main thread talks to the oracle. We override `search()` instead of
+`run_trial()`:
+
+- We declare the hyperparameters with `oracle.update_space()` before creating
+the trials, so that the oracle samples them for all the trials.
+- We create the trials in batches of `max_workers` with
+`oracle.create_trial()`. The oracle tracks one ongoing trial per tuner ID, so
+each pending trial gets its own ID.
+- We run them in the pool, and report the results with `oracle.update_trial()`
+as they complete. `on_trial_end()` ends the trial and saves the tuner.
+"""
+
+import concurrent.futures
+
+
+def create_trials(tuner, num_trials):
+    trials = []
+    for index in range(num_trials):
+        trial = tuner.oracle.create_trial(f"{tuner.tuner_id}_{index}")
+        # The oracle has no more trials to run.
+        if trial.status == keras_tuner.engine.trial.TrialStatus.STOPPED:
+            break
+        trials.append(trial)
+    return trials
+
+
+class ParallelTuner(MyTuner):
+    def search(self, max_workers=3):
+        hp = keras_tuner.HyperParameters()
+        hp.Int("units", 32, 128, 32)
+        hp.Choice("optimizer", ["adam", "adadelta"])
+        self.oracle.update_space(hp)
+        self.on_search_begin()
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            while True:
+                trials = create_trials(self, max_workers)
+                if not trials:
+                    break
+                futures = {}
+                for trial in trials:
+                    self.on_trial_begin(trial)
+                    futures[executor.submit(self.run_trial, trial)] = trial
+                for future in concurrent.futures.as_completed(futures):
+                    trial = futures[future]
+                    self.oracle.update_trial(
+                        trial.trial_id, {"default_objective": future.result()}
+                    )
+                    # The oracle only scores the completed trials.
+                    trial.status = keras_tuner.engine.trial.TrialStatus.COMPLETED
+                    self.on_trial_end(trial)
+        self.on_search_end()
+
+
+tuner = ParallelTuner(
+    max_trials=6, overwrite=True, directory="my_dir", project_name="keep_code_parallel",
+)
+tuner.search()
+print(tuner.get_best_hyperparameters()[0].values)
+
 """
 ## KerasTuner includes pre-made tunable applications: HyperResNet and HyperXception
 
 These are ready-to-use hypermodels for computer vision.
 
 They come pre-compiled with `loss="categorical_crossentropy"` and
-`metrics=["accuracy"]`.
+`metrics=["accuracy"]`. Our labels are integers instead of one-hot vectors, so
+we override the loss with the `loss` argument of the tuner. When overriding the
+compile arguments, also pass the `metrics` to keep them.
 
 """
 
@@ -862,15 +1323,69 @@ from keras_tuner.applications import HyperResNet
 
 hypermodel = HyperResNet(input_shape=(28, 28, 1), classes=10)
 
-tuner = keras_tuner.RandomSearch(
-    hypermodel,
-    objective="val_accuracy",
-    max_trials=2,
-    overwrite=True,
-    directory="my_dir",
-    project_name="built_in_hypermodel",
-)
+"""
+ResNets spend most of their time in convolutions. On GPUs with bfloat16 tensor
+cores (compute capability 8.0 and above, like the A100), you can train them
+faster with the `"mixed_bfloat16"` policy: the layers compute in bfloat16 and
+keep their variables in float32. Unlike float16, bfloat16 has the same range
+as float32, so no loss scaling is needed.
+
+The last layer should still compute in float32 for numerical stability, so that
+the loss is not computed on bfloat16 probabilities. The softmax layer of
+`HyperResNet` follows the global policy, so in this case we build the ResNet
+without its top with `include_top=False`, and add our own output layer with
+`dtype="float32"`. Without its top, `HyperResNet` does not define the
+`optimizer` and `learning_rate` hyperparameters, so we define them the same way
+when compiling the model, which keeps the same search space.
+
+The policy applies to the models created after it is set. We set it back to
+`"float32"` after the search, even if the search fails.
+"""
 
-tuner.search(
-    x_train[:100], y_train[:100], epochs=1, validation_data=(x_val[:100], y_val[:100])
-)
+
+class MixedPrecisionHyperResNet(keras_tuner.HyperModel):
+    def build(self, hp):
+        model = HyperResNet(input_shape=(28, 28, 1), include_top=False).build(hp)
+        outputs = layers.Dense(10, activation="softmax", dtype="float32")(model.output)
+        model = keras.Model(model.inputs, outputs)
+        # Tune the optimizer as `HyperResNet` does with its top.
+        optimizer = keras.optimizers.get(
+            hp.Choice("optimizer", ["adam", "rmsprop", "sgd"], default="adam")
+        )
+        optimizer.learning_rate = hp.Choice(
+            "learning_rate", [0.1, 0.01, 0.001], default=0.01
+        )
+        model.compile(
+            optimizer=optimizer,
+            loss="sparse_categorical_crossentropy",
+            metrics=["accuracy"],
+        )
+        return model
+
+
+if gpus and tf.config.experimental.get_device_details(gpus[0]).get(
+    "compute_capability", (0, 0)
+) >= (8, 0):
+    keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    hypermodel = MixedPrecisionHyperResNet()
+
+try:
+    tuner = keras_tuner.RandomSearch(
+        hypermodel,
+        objective="val_accuracy",
+        max_trials=2,
+        overwrite=True,
+        directory="my_dir",
+        project_name="built_in_hypermodel",
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+        distribution_strategy=strategy,
+    )
+
+    tuner.search(
+        make_dataset(x_train[:100], y_train[:100]),
+        epochs=1,
+        validation_data=make_dataset(x_val[:100], y_val[:100]),
+    )
+finally:
+    keras.mixed_precision.set_global_policy("float32")